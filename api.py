@@ -1,10 +1,13 @@
 from db import FotmobDB
+from simplify import get_player_simplified
 from utils import configure_logger
 
 import functools
+import glob
 import json
 import os
 import time
+from datetime import datetime
 from urllib.parse import urlparse, parse_qs
 
 import requests
@@ -37,7 +40,7 @@ def get_player(player_id):
     logger.info(f"Getting player {player_id} from api.")
     response = requests.get(f"{api_host}/playerData?id={player_id}", headers=no_cache_headers).json()
     if response:
-        db.get_players_table().insert(get_player_simplified(response))
+        db.insert_player(get_player_simplified(response))
         player = db.get_player(player_id)
         if not player:
             logger.error(f"Player {player_id} not found.")
@@ -46,49 +49,59 @@ def get_player(player_id):
         return player
     
 
-def get_player_simplified(player):
-    """
-    Takes player data with Fotmob API schema and returns dict with simplified collection of data. 
-    Intent to be used to save player data to local database.
+def get_transfer_row(t):
+    on_loan = t["onLoan"]
+    fee = t["fee"] or {}
+    fee_value = fee.get("value")
+    name = t["name"]
+    player_id = t["playerId"]
+    date = t["transferDate"]
+    position = t.get("position") or {}
+    position = position.get("label")
+    from_club = t["fromClub"]
+    to_club = t["toClub"]
+    market_value = t.get("marketValue")
+    return {
+        "name": name,
+        "id": player_id,
+        "date": str(datetime.fromisoformat(date).date()),
+        "position": position,
+        "from_club": from_club,
+        "to_club": to_club,
+        "market_value": market_value,
+        "fee": fee_value,
+        "on_loan": on_loan
+    }
+
+
+def get_league_transfers_path(league_id):
+    return f"{data_dir}/transfers/{league_id}/{datetime.today().year}.json"
 
-    param: player (dict)
 
-    returns: dict - simplfied
+def append_league_transfers(league_id, transfers):
     """
-    player_props_data = {}
-    position_data = player["origin"]["positionDesc"]
-    positions = sorted(position_data.get("positions", []), key=lambda d: (-d["isMainPosition"], d["occurences"]))
-    positions = [p["strPosShort"]["label"] for p in positions]
-    for prop in player["playerProps"]:
-        title = "_".join(prop["title"].split()).lower()
-        player_props_data[title] = prop["value"]["key"] or prop["value"]["fallback"]
-    
-    clubs = []
-    career_history_info = player["careerHistory"]
-    if career_history_info["fullCareer"]:
-        for club in career_history_info["careerData"]["careerItems"]["senior"]:
-            if not club["hasUncertainData"]:
-                clubs.append({
-                    "team_name": club["team"],
-                    "team_id": club["teamId"],
-                    "transfer_type": club["transferType"],
-                    "start_date": club["startDate"],
-                    "end_date": club.get("endDate"),
-                    "appearances": club["appearances"]
-                })
+    Adds new transfer rows ({"players_in": [...], "players_out": [...]}) to the
+    saved transfer list for the league's current year. Returns the rows added.
+    """
+    path = get_league_transfers_path(league_id)
+    saved = {"players_in": [], "players_out": []}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            saved = json.load(f) or saved
 
-    return {
-        "id": player["id"],
-        "name": player["name"],
-        "on_loan": player["origin"].get("onLoan"),
-        "team": {
-            "name": player["origin"].get("teamName"),
-            "id": player["origin"].get("teamId")
-        },
-        "positions": positions,
-        "clubs": clubs,
-        **player_props_data
-    }
+    added = []
+    for key in ("players_in", "players_out"):
+        seen = {(t["id"], t["date"], t["from_club"], t["to_club"]) for t in saved.get(key, [])}
+        for t in transfers.get(key, []):
+            if (t["id"], t["date"], t["from_club"], t["to_club"]) not in seen:
+                saved.setdefault(key, []).append(t)
+                added.append(t)
+
+    if added:
+        os.makedirs(os.path.split(path)[0], exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(saved, f)
+    return added
 
 
 @functools.lru_cache(maxsize=100)
@@ -109,27 +122,10 @@ def get_league_season_totw(league_id, season_year):
         with open(path, "r") as f:
             totws = json.load(f)
             if totws:
+                db.index_totws(league_id, season_year, totws)
                 return totws
     
-    league = get_league(league_id)
-    if league:
-        # logger.info(f"Getting stat links from league {league_id}")
-        totw_links = []
-        for item in league["stats"]["seasonStatLinks"]:
-            totw_links.append({
-                "name": item["Name"],
-                "tournament": item["TournamentId"],
-                "link": item["TotwRoundsLink"]
-            })
-    
-    rounds_link = None
-    for item in totw_links:
-        if int(item["name"].split("/")[0]) == int(season_year):
-            rounds_link = item["link"]
-            logger.info(f"Using rounds link {rounds_link}")
-            break
-
-    
+    rounds_link = get_league_season_totw_rounds_link(league_id, season_year)
     totws = []
     if rounds_link:
         logger.info(f"Getting TOTW from {rounds_link}.")
@@ -140,7 +136,7 @@ def get_league_season_totw(league_id, season_year):
                 for r in rounds:
                     link = r["link"]
                     totw = requests.get(r["link"]).json()
-                    round_id = parse_qs(urlparse(link).query)["roundid"][0]
+                    round_id = get_totw_round_id(link)
                     logger.info(f"Getting TOTW for {r}. Url: {link}")
                     if totw and not "errorMessage" in totw:
                         
@@ -152,10 +148,58 @@ def get_league_season_totw(league_id, season_year):
         os.makedirs(os.path.split(path)[0], exist_ok=True)
         with open(path, "w") as f:
             json.dump(totws, f)
+        db.index_totws(league_id, season_year, totws)
 
     return totws
 
 
+def get_league_season_totw_rounds_link(league_id, season_year):
+    league = get_league(league_id)
+    if not league:
+        return
+
+    for item in league["stats"]["seasonStatLinks"]:
+        if int(item["Name"].split("/")[0]) == int(season_year):
+            rounds_link = item["TotwRoundsLink"]
+            logger.info(f"Using rounds link {rounds_link}")
+            return rounds_link
+
+
+def get_totw_round_id(link):
+    return parse_qs(urlparse(link).query)["roundid"][0]
+
+
+def append_league_season_totw(league_id, season_year, totws):
+    """
+    Adds new rounds to the saved TOTW data for a season and indexes them.
+    """
+    path = f"{data_dir}/totw/{league_id}/{season_year}.json"
+    saved = []
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            saved = json.load(f) or []
+
+    saved_rounds = {str(t["round"]) for t in saved}
+    saved.extend(t for t in totws if str(t["round"]) not in saved_rounds)
+    os.makedirs(os.path.split(path)[0], exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(saved, f)
+    db.index_totws(league_id, season_year, totws)
+
+
+def index_cached_league_totws(league_id=None):
+    """
+    Indexes TOTW data already saved for league_id, or for every league if not
+    given. Reads the saved files directly, so doesn't hit the api.
+    """
+    for path in glob.glob(f"{data_dir}/totw/{league_id or '*'}/*.json"):
+        league_dir, file_name = os.path.split(path)
+        with open(path, "r") as f:
+            totws = json.load(f)
+        if totws:
+            db.index_totws(int(os.path.basename(league_dir)), int(os.path.splitext(file_name)[0]), totws)
+
+
 def group_totw_data(league_id, season_year):
     totws = get_league_season_totw(league_id, season_year)
     totw_ratings = {}
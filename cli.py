@@ -1,5 +1,8 @@
 import api
+import ingest
+import query
 import utils
+import watch
 
 import csv
 import glob
@@ -66,6 +69,30 @@ def get_player_row(player, short_name=False):
     }
 
 
+def get_record_row(player_id, record):
+    """
+    Same row as get_player_row, built from a player index record.
+    """
+    team = record["team_name"]
+    if record["on_loan"]:
+        team = f"{team} (on loan)"
+
+    market_value = record["market_value_label"]
+    if market_value:
+        market_value = market_value.lower()
+
+    return {
+        "name": record["name"],
+        "id": player_id,
+        "positions": "/".join(record["positions"]),
+        "age": record["age"],
+        "apps": record["apps"],
+        "market_value": market_value,
+        "country": utils.get_country_code(record["country"]) if record["country"] else None,
+        "team": team or "n/a"
+    }
+
+
 @click.group()
 def cli():
     """
@@ -81,6 +108,58 @@ def get_player(player_id):
     print(format_display_table([get_player_row(player)]))
 
 
+@cli.command
+@click.argument("query", type=click.STRING, required=True)
+@click.option("-t", "--team", type=click.STRING)
+@click.option("-p", "--position", type=click.STRING)
+@click.option("-mn_a", "--min-age", type=click.INT)
+@click.option("-mx_a", "--max-age", type=click.INT)
+@click.option("-l", "--limit", type=click.INT, default=10)
+def search_player(query, team, position, min_age, max_age, limit):
+    matches = api.db.search_players(
+        query,
+        limit=limit,
+        team=team,
+        position=position,
+        min_age=min_age,
+        max_age=max_age
+    )
+    if not matches:
+        print(f"No players found for {query}.")
+        return
+
+    records = api.db.get_player_index().records
+    table = []
+    for match in matches:
+        row = get_record_row(match["id"], records[match["id"]])
+        row["score"] = match["score"]
+        table.append(row)
+
+    print(format_display_table(table))
+
+
+@cli.command
+@click.argument("player_ids", type=click.INT, nargs=-1)
+@click.option("-l", "--league-id", type=click.INT)
+@click.option("-y", "--season-year", type=click.INT)
+@click.option("-r", "--refresh", type=click.BOOL, default=False)
+@click.option("-w", "--workers", type=click.INT)
+def ingest_players(player_ids, league_id, season_year, refresh, workers):
+    player_ids = list(player_ids)
+    if league_id and season_year:
+        player_ids.extend(api.group_totw_data(league_id, season_year).keys())
+
+    count = ingest.ingest_players(player_ids, refresh=refresh, workers=workers)
+    print(f"Saved {count} players.")
+
+
+@cli.command
+@click.option("-w", "--workers", type=click.INT)
+def reprocess_players(workers):
+    count = ingest.reprocess_archived_players(workers=workers)
+    print(f"Reprocessed {count} players.")
+
+
 @cli.command
 @click.argument("league_id", type=click.INT, required=True)
 @click.argument("season_year", type=click.INT, required=True)
@@ -130,10 +209,10 @@ def aggregate_totw_data(league_id, until, save):
         year -= 1
 
     season_groupings = merge_groupings(*season_groupings)
+    ingest.ingest_players(season_groupings.keys())
     player_table = []
     start = time.time()
     print(f"Looking up {len(season_groupings)} players...")
-    print(f"Expected time: {round(len(season_groupings) /(1.29 * 60), 2)}m")
     for i in season_groupings:
         print(f"Getting player {i}")
         player = api.get_player(i)
@@ -179,6 +258,27 @@ def aggregate_totw_data(league_id, until, save):
             writer.writerows(player_table)
 
 
+@cli.command("watch")
+@click.argument("league_ids", type=click.INT, nargs=-1, required=True)
+@click.option("-y", "--season-year", type=click.INT)
+@click.option("-t", "--totw-interval", type=click.INT, default=60, help="Minutes between TOTW polls.")
+@click.option("-i", "--transfer-interval", type=click.INT, default=360, help="Minutes between transfer polls per team.")
+@click.option("-m", "--max-interval", type=click.INT, default=7 * 24 * 60, help="Longest backoff in minutes.")
+@click.option("-o", "--once", type=click.BOOL, default=False)
+def watch_leagues(league_ids, season_year, totw_interval, transfer_interval, max_interval, once):
+    """
+    Polls leagues for new TOTW rounds and transfers and saves them as they appear.
+    """
+    watch.watch(
+        league_ids,
+        once=once,
+        season_year=season_year,
+        totw_interval=totw_interval * 60,
+        transfer_interval=transfer_interval * 60,
+        max_interval=max_interval * 60
+    )
+
+
 @cli.command
 @click.argument("league_id", type=click.INT, required=True)
 @click.option("-u", "--until", type=click.INT)
@@ -321,6 +421,39 @@ def get_master_table(min_age, max_age, min_market_value, max_market_value, min_t
         print(mv_mean)
 
 
+@cli.command
+@click.argument("expression", type=click.STRING, required=False)
+@click.option("-l", "--league-id", type=click.INT, multiple=True)
+@click.option("-u", "--until", type=click.INT)
+@click.option("-r", "--rank", type=click.STRING)
+@click.option("-n", "--limit", type=click.INT, default=50)
+def query_players(expression, league_id, until, rank, limit):
+    """
+    Filters players with an expression like "age < 23 and apps < 30 and totw >= 3
+    and market_value < 5M" and ranks them by weighted fields, e.g. "totw_rate=1,avg_rating=0.5".
+    Fields are normalized before weighting. totw_rate is TOTWs in the selected leagues
+    per career appearance.
+    """
+    api.index_cached_league_totws()
+    totw_index = api.db.get_totw_index()
+    rows = query.get_rows(api.db.get_player_index(), totw_index, league_ids=set(league_id), min_season_year=until)
+    try:
+        results = query.run_query(rows, expression=expression, rank=rank, limit=limit)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    if not results:
+        print("No players found.")
+        return
+
+    for row in results:
+        if row["market_value"]:
+            row["market_value"] = get_price_string(row["market_value"])
+
+    print(format_display_table(results))
+    print(format_display_table([{"count": len(results)}]))
+
+
 def get_price_string(p):
     if p >= 1000000000:
         return f"€{round(float(p/1000000000), 1)}B"
@@ -330,31 +463,6 @@ def get_price_string(p):
         return f"€{round(float(p/1000))}K"
 
 
-def get_transfer_row(t):
-    on_loan = t["onLoan"]
-    fee = t["fee"] or {}
-    fee_value = fee.get("value")
-    name = t["name"]
-    player_id = t["playerId"]
-    date = t["transferDate"]
-    position = t.get("position") or {}
-    position = position.get("label")
-    from_club = t["fromClub"]
-    to_club = t["toClub"]
-    market_value = t.get("marketValue")
-    return {
-        "name": name,
-        "id": player_id,
-        "date": str(datetime.fromisoformat(date).date()),
-        "position": position,
-        "from_club": from_club,
-        "to_club": to_club,
-        "market_value": market_value,
-        "fee": fee_value,
-        "on_loan": on_loan
-    }
-
-
 def print_header(h, space_length=5, char="=", side_char="||"):
     spaces = " " * space_length
     header = f"{side_char}{spaces}{h}{spaces}{side_char}"
@@ -393,8 +501,8 @@ def get_league_transfer_list(league_id, display, transfers_in, transfers_out, ig
             team = api.get_team(t)
             if team:
                 if team.get("transfers"):
-                    players_in = [get_transfer_row(t) for t in team.get("transfers", {}).get("data", {}).get("Players in", [])]
-                    players_out = [get_transfer_row(t) for t in team.get("transfers", {}).get("data", {}).get("Players out", [])]
+                    players_in = [api.get_transfer_row(t) for t in team.get("transfers", {}).get("data", {}).get("Players in", [])]
+                    players_out = [api.get_transfer_row(t) for t in team.get("transfers", {}).get("data", {}).get("Players out", [])]
                     if players_in:
                         transfers["players_in"].extend(players_in)
                     if players_out:
@@ -1,3 +1,7 @@
+from index import PlayerIndex, TotwIndex
+
+import os
+
 from loguru import logger
 from tinydb import TinyDB, Query
 
@@ -11,6 +15,11 @@ class FotmobDB:
         if cls._instance is None:
             cls._instance = super(FotmobDB, cls).__new__(cls)
             cls._instance.db = TinyDB(db_file)
+            cls._instance.db_file = db_file
+            cls._instance.player_index_file = f"{os.path.splitext(db_file)[0]}_index.json"
+            cls._instance.player_index = None
+            cls._instance.totw_index_file = f"{os.path.splitext(db_file)[0]}_totw_index.json"
+            cls._instance.totw_index = None
         return cls._instance
     
     def get_players_table(self):
@@ -18,7 +27,51 @@ class FotmobDB:
     
     def get_player(self, player_id):
         return self.get_players_table().get(Query().id == player_id)
+
+    def get_player_index(self):
+        """
+        Loads the player search index on first use, catching up on any changes
+        to the players table since it was last saved.
+        """
+        if self.player_index is None:
+            logger.info(f"Loading player index from {self.player_index_file}.")
+            self.player_index = PlayerIndex.load(self.player_index_file, self.get_players_table(), self.db_file)
+        return self.player_index
+
+    def insert_player(self, player):
+        player_index = self.get_player_index()
+        doc_id = self.get_players_table().insert(player)
+        player_index.add(player, doc_id)
+        player_index.save()
+        return doc_id
+
+    def insert_players(self, players):
+        """
+        Inserts players, replacing any already saved with the same id.
+        """
+        player_index = self.get_player_index()
+        players_table = self.get_players_table()
+        players_table.remove(Query().id.one_of([p["id"] for p in players]))
+        doc_ids = players_table.insert_multiple(players)
+        for player, doc_id in zip(players, doc_ids):
+            player_index.add(player, doc_id)
+        player_index.save()
+        return doc_ids
+
+    def search_players(self, query, **filters):
+        return self.get_player_index().search(query, **filters)
+
+    def get_totw_index(self):
+        if self.totw_index is None:
+            self.totw_index = TotwIndex.load(self.totw_index_file)
+        return self.totw_index
+
+    def index_totws(self, league_id, season_year, totws):
+        totw_index = self.get_totw_index()
+        added = totw_index.add_season(league_id, season_year, totws)
+        totw_index.save()
+        return added
     
 
 if __name__ == "__main__":
-    db = FotmobDB()
\ No newline at end of file
+    db = FotmobDB()
@@ -0,0 +1,411 @@
+import utils
+
+import json
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+
+# Letters NFKD leaves alone but people type without the diacritic.
+folded_letters = str.maketrans({
+    "ø": "o",
+    "ł": "l",
+    "đ": "d",
+    "ð": "d",
+    "þ": "th",
+    "ß": "ss",
+    "æ": "ae",
+    "œ": "oe",
+    "ı": "i",
+})
+
+
+def fold_text(text):
+    """
+    Lowercases text and strips accents, so "Ødegaard" and "odegaard" compare equal.
+    """
+    text = unicodedata.normalize("NFKD", str(text or "").lower().translate(folded_letters))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+
+def get_name_grams(name):
+    """
+    Returns the set of trigrams for each word in name. Words are padded so short
+    names and word prefixes still produce grams.
+    """
+    grams = set()
+    for word in fold_text(name).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def parse_age(age):
+    try:
+        return int(age)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_apps(player):
+    apps = [re.match(r"(\d+)", club["appearances"] or "") for club in player.get("clubs") or []]
+    return sum(int(a.group()) for a in apps if a)
+
+
+def get_player_record(player, doc_id):
+    team = player.get("team") or {}
+    return {
+        "doc_id": doc_id,
+        "name": player["name"],
+        "team_id": team.get("id"),
+        "team_name": team.get("name"),
+        "on_loan": player.get("on_loan"),
+        "country": player.get("country"),
+        "positions": player.get("positions") or [],
+        "age": parse_age(player.get("age")),
+        "apps": get_apps(player),
+        "market_value_label": player.get("market_value"),
+        "market_value": utils.convert_price_string(player.get("market_value"))
+    }
+
+
+def get_file_stamp(path):
+    if path and os.path.exists(path):
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+
+class PlayerIndex:
+    """
+    In-memory trigram index over player names in the local players table, with
+    secondary indexes on team, position and age for filtering.
+
+    Persisted as a snapshot at path plus an append-only log of changes at
+    path.log, which is folded into the snapshot when the index is loaded. The
+    table file's mtime and size are kept at path.stamp, so loading skips the
+    scan of the table when it hasn't changed since the index was last saved.
+    """
+    version = 4
+
+    def __init__(self, path, table_path=None):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.stamp_path = f"{path}.stamp"
+        self.table_path = table_path
+        self.records = {}
+        self.grams = defaultdict(set)
+        self.teams = defaultdict(set)
+        self.positions = defaultdict(set)
+        self.ages = defaultdict(set)
+        self.pending = []
+        self.log_size = 0
+
+    @classmethod
+    def load(cls, path, table, table_path=None):
+        """
+        Loads the persisted index at path and replays its log, then reconciles it
+        with table if table_path changed since the last save. Builds from scratch
+        if nothing usable is persisted.
+        """
+        index = cls(path, table_path)
+        snapshot_loaded = False
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+
+            if data.get("version") == cls.version:
+                snapshot_loaded = True
+                for player_id, record in data["records"].items():
+                    index.records[int(player_id)] = record
+                    index._add_attributes(int(player_id), record)
+                for gram, player_ids in data["grams"].items():
+                    index.grams[gram] = set(player_ids)
+
+        if snapshot_loaded and os.path.exists(index.log_path):
+            with open(index.log_path, "r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    index._remove_record(entry["id"])
+                    if entry["record"]:
+                        index._add_record(entry["id"], entry["record"])
+                    index.log_size += 1
+
+        if not snapshot_loaded or not index.is_stamp_current():
+            index.sync(table)
+
+        if not snapshot_loaded or index.log_size + len(index.pending) > max(1000, len(index.records) // 10):
+            index.compact()
+        else:
+            index.save()
+        index.write_stamp()
+        return index
+
+    def is_stamp_current(self):
+        if not self.table_path or not os.path.exists(self.stamp_path):
+            return False
+
+        with open(self.stamp_path, "r") as f:
+            return json.load(f) == get_file_stamp(self.table_path)
+
+    def write_stamp(self):
+        """
+        Records the table file's current state. Call after the table and index
+        have been updated together.
+        """
+        stamp = get_file_stamp(self.table_path)
+        if stamp:
+            with open(self.stamp_path, "w") as f:
+                json.dump(stamp, f)
+
+    def sync(self, table):
+        """
+        Re-indexes players whose doc is missing from the index or has moved, and
+        drops players no longer in table.
+        """
+        seen = set()
+        for doc in table:
+            player_id = doc["id"]
+            if player_id in seen:
+                continue
+
+            seen.add(player_id)
+            record = self.records.get(player_id)
+            if not record or record["doc_id"] != doc.doc_id:
+                self.add(doc, doc.doc_id)
+
+        for player_id in set(self.records) - seen:
+            self.remove(player_id)
+
+    def save(self):
+        """
+        Appends changes since the last save to the log.
+        """
+        if not self.pending:
+            return
+
+        os.makedirs(os.path.split(self.path)[0] or ".", exist_ok=True)
+        with open(self.log_path, "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in self.pending)
+        self.log_size += len(self.pending)
+        self.pending = []
+        self.write_stamp()
+
+    def compact(self):
+        """
+        Writes the whole index to the snapshot and clears the log.
+        """
+        data = {
+            "version": self.version,
+            "records": self.records,
+            "grams": {gram: list(player_ids) for gram, player_ids in self.grams.items() if player_ids}
+        }
+        os.makedirs(os.path.split(self.path)[0] or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.pending = []
+        self.log_size = 0
+
+    def add(self, player, doc_id):
+        player_id = player["id"]
+        record = get_player_record(player, doc_id)
+        self._remove_record(player_id)
+        self._add_record(player_id, record)
+        self.pending.append({"id": player_id, "record": record})
+
+    def remove(self, player_id):
+        if self._remove_record(player_id):
+            self.pending.append({"id": player_id, "record": None})
+
+    def _add_record(self, player_id, record):
+        self.records[player_id] = record
+        self._add_attributes(player_id, record)
+        for gram in get_name_grams(record["name"]):
+            self.grams[gram].add(player_id)
+
+    def _remove_record(self, player_id):
+        record = self.records.pop(player_id, None)
+        if not record:
+            return False
+
+        for gram in get_name_grams(record["name"]):
+            self.grams[gram].discard(player_id)
+        for key, index in self._get_attribute_keys(record):
+            index[key].discard(player_id)
+        return True
+
+    def _get_attribute_keys(self, record):
+        keys = []
+        if record["team_id"] is not None:
+            keys.append((str(record["team_id"]), self.teams))
+        if record["team_name"]:
+            keys.append((fold_text(record["team_name"]), self.teams))
+        for position in record["positions"]:
+            keys.append((position.upper(), self.positions))
+        if record["age"] is not None:
+            keys.append((record["age"], self.ages))
+        return keys
+
+    def _add_attributes(self, player_id, record):
+        for key, index in self._get_attribute_keys(record):
+            index[key].add(player_id)
+
+    def filter(self, team=None, position=None, min_age=None, max_age=None):
+        """
+        Returns the set of player ids matching every given filter, or None when no
+        filters are given. team may be a team id or a team name.
+        """
+        matches = []
+        if team is not None:
+            team = str(team)
+            matches.append(self.teams.get(team if team.isdigit() else fold_text(team), set()))
+
+        if position:
+            matches.append(self.positions.get(position.upper(), set()))
+
+        if min_age is not None or max_age is not None:
+            ages = set()
+            for age, player_ids in self.ages.items():
+                if (min_age is None or age >= min_age) and (max_age is None or age <= max_age):
+                    ages.update(player_ids)
+            matches.append(ages)
+
+        if not matches:
+            return None
+
+        matches = sorted(matches, key=len)
+        return matches[0].intersection(*matches[1:])
+
+    def search(self, query, limit=10, min_score=0.3, **filters):
+        """
+        Returns up to limit players ranked by how many of the query's trigrams their
+        name shares. Ties go to the closer overall match (trigram jaccard).
+        """
+        candidates = self.filter(**filters)
+        query_grams = get_name_grams(query)
+        if not query_grams:
+            player_ids = self.records.keys() if candidates is None else candidates
+            matches = [(0, 0, player_id) for player_id in player_ids]
+        else:
+            shared = Counter()
+            if candidates is not None and len(candidates) < len(query_grams) * 64:
+                for player_id in candidates:
+                    shared[player_id] = len(query_grams & get_name_grams(self.records[player_id]["name"]))
+            else:
+                for gram in query_grams:
+                    for player_id in self.grams.get(gram, ()):
+                        if candidates is None or player_id in candidates:
+                            shared[player_id] += 1
+
+            matches = []
+            for player_id, count in shared.items():
+                coverage = count / len(query_grams)
+                if count and coverage >= min_score:
+                    name_grams = get_name_grams(self.records[player_id]["name"])
+                    jaccard = count / (len(query_grams) + len(name_grams) - count)
+                    matches.append((coverage, jaccard, player_id))
+
+        matches = sorted(matches, key=lambda m: (-m[0], -m[1], self.records[m[2]]["name"]))
+        return [{
+            "id": player_id,
+            "doc_id": self.records[player_id]["doc_id"],
+            "name": self.records[player_id]["name"],
+            "score": round((coverage + jaccard) / 2, 3)
+        } for coverage, jaccard, player_id in matches[:limit]]
+
+
+class TotwIndex:
+    """
+    Per league season TOTW counts and ratings for each player, keyed by round so
+    seasons can be updated a round at a time.
+    """
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.seasons = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        index = cls(path)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+
+            if data.get("version") == cls.version:
+                index.seasons = data["seasons"]
+        return index
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        os.makedirs(os.path.split(self.path)[0] or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.version, "seasons": self.seasons}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def has_round(self, league_id, season_year, round_id):
+        season = self.seasons.get(f"{league_id}/{season_year}")
+        return bool(season) and str(round_id) in season["rounds"]
+
+    def add_round(self, league_id, season_year, totw):
+        """
+        Adds one TOTW (as saved by api.get_league_season_totw). Rounds already
+        indexed are skipped.
+        """
+        if self.has_round(league_id, season_year, totw["round"]):
+            return False
+
+        season = self.seasons.setdefault(f"{league_id}/{season_year}", {"rounds": [], "players": {}})
+        season["rounds"].append(str(totw["round"]))
+        for player in totw["players"]:
+            stats = season["players"].setdefault(str(player["participantId"]), [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += float(player["rating"] or 0)
+            stats[2] += int(bool(player["motm"]))
+
+        self.dirty = True
+        return True
+
+    def add_season(self, league_id, season_year, totws):
+        return sum(self.add_round(league_id, season_year, totw) for totw in totws)
+
+    def get_seasons(self, league_ids=None, min_season_year=None):
+        seasons = []
+        for key in self.seasons:
+            league_id, season_year = (int(k) for k in key.split("/"))
+            if league_ids and league_id not in league_ids:
+                continue
+            if min_season_year and season_year < min_season_year:
+                continue
+            seasons.append((league_id, season_year))
+        return sorted(seasons)
+
+    def get_player_stats(self, league_ids=None, min_season_year=None):
+        """
+        Returns {player_id: {"totw", "motm", "avg_rating"}} merged across the matching seasons.
+        """
+        merged = {}
+        for league_id, season_year in self.get_seasons(league_ids, min_season_year):
+            for player_id, (count, rating_sum, motm) in self.seasons[f"{league_id}/{season_year}"]["players"].items():
+                stats = merged.setdefault(int(player_id), [0, 0.0, 0])
+                stats[0] += count
+                stats[1] += rating_sum
+                stats[2] += motm
+
+        return {
+            player_id: {
+                "totw": count,
+                "motm": motm,
+                "avg_rating": round(rating_sum / count, 2)
+            } for player_id, (count, rating_sum, motm) in merged.items()
+        }
@@ -0,0 +1,170 @@
+"""
+Bulk player ingestion. Fetching runs in a thread pool, simplifying raw playerData
+payloads runs in a process pool and the results are written to the db in batches,
+with each stage running ahead of the next by a bounded number of items.
+"""
+
+import api
+from simplify import simplify_payload
+
+import glob
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+
+archive_dir = f"{api.data_dir}/players"
+logger = api.logger
+
+request_interval = 0.1
+max_retries = 3
+
+
+class RateLimiter:
+    """
+    Spaces out calls to wait() across threads by at least interval seconds.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last_call = 0
+
+    def wait(self):
+        with self.lock:
+            delay = self.last_call + self.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.last_call = time.monotonic()
+
+
+rate_limiter = RateLimiter(request_interval)
+
+
+def bounded_map(executor, fn, items, max_pending):
+    """
+    Like executor.map, but only keeps max_pending items in flight, so items is
+    consumed lazily and results are yielded (in order) while later items are
+    still being worked on.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def get_retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return int(retry_after)
+    return 2 ** attempt
+
+
+def fetch_player_payload(player_id):
+    """
+    Fetches raw playerData for player_id and archives it so it can be
+    re-simplified later without hitting the api. Requests are rate limited and
+    retried on 429, 5xx and connection errors. Returns (player_id, payload).
+    """
+    for attempt in range(max_retries + 1):
+        rate_limiter.wait()
+        try:
+            response = requests.get(f"{api.api_host}/playerData?id={player_id}", headers=api.no_cache_headers)
+        except requests.RequestException as e:
+            response, error = None, e
+        else:
+            if response.status_code == 429 or response.status_code >= 500:
+                error = f"status {response.status_code}"
+            elif not response.ok:
+                logger.error(f"Failed getting player {player_id}: status {response.status_code}")
+                return player_id, None
+            else:
+                break
+
+        if attempt == max_retries:
+            logger.error(f"Failed getting player {player_id} after {max_retries} retries: {error}")
+            return player_id, None
+
+        delay = get_retry_delay(response, attempt)
+        logger.info(f"Retrying player {player_id} in {delay}s ({error}).")
+        time.sleep(delay)
+
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(f"{archive_dir}/{player_id}.json", "wb") as f:
+        f.write(response.content)
+
+    return player_id, response.content
+
+
+def read_archived_payload(path):
+    with open(path, "rb") as f:
+        return path, f.read()
+
+
+def write_players(results, batch_size):
+    """
+    Writes simplified players to the db in batches of batch_size. Returns count written.
+    """
+    count = 0
+    batch = []
+    for source, player, error in results:
+        if not player:
+            logger.error(f"Skipping {source}: {error}")
+            continue
+
+        batch.append(player)
+        if len(batch) >= batch_size:
+            api.db.insert_players(batch)
+            count += len(batch)
+            logger.success(f"Saved {count} players.")
+            batch = []
+
+    if batch:
+        api.db.insert_players(batch)
+        count += len(batch)
+        logger.success(f"Saved {count} players.")
+
+    return count
+
+
+def process_payloads(payloads, workers=None, batch_size=100):
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers) as executor:
+        results = bounded_map(executor, simplify_payload, payloads, workers * 4)
+        return write_players(results, batch_size)
+
+
+def ingest_players(player_ids, refresh=False, fetch_workers=4, workers=None, batch_size=100):
+    """
+    Fetches, simplifies and saves players. Players already in the db are skipped
+    unless refresh is set. Returns count saved.
+    """
+    player_ids = list(dict.fromkeys(player_ids))
+    if not refresh:
+        indexed = api.db.get_player_index().records
+        player_ids = [i for i in player_ids if i not in indexed]
+
+    if not player_ids:
+        return 0
+
+    logger.info(f"Ingesting {len(player_ids)} players.")
+    with ThreadPoolExecutor(fetch_workers) as executor:
+        payloads = bounded_map(executor, fetch_player_payload, player_ids, fetch_workers * 4)
+        return process_payloads(payloads, workers=workers, batch_size=batch_size)
+
+
+def reprocess_archived_players(workers=None, batch_size=500):
+    """
+    Re-simplifies every archived playerData payload and overwrites the saved players.
+    """
+    paths = glob.glob(f"{archive_dir}/*.json")
+    logger.info(f"Reprocessing {len(paths)} archived players.")
+    payloads = (read_archived_payload(path) for path in paths)
+    return process_payloads(payloads, workers=workers, batch_size=batch_size)
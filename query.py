@@ -0,0 +1,181 @@
+"""
+Scouting queries over the player index joined with TOTW stats, e.g.
+
+    age < 23 and apps < 30 and totw >= 3 and market_value < 5M
+
+Expressions are "field op value" clauses joined with "and"/"or" ("and" binds
+tighter) and are compiled into a single predicate, applied in one pass.
+
+totw, motm and avg_rating cover the selected leagues and seasons, but apps is
+career senior appearances across all clubs (the store has no per-season apps),
+so totw_rate is TOTWs in the selection per career appearance.
+"""
+
+import operator
+import re
+
+operators = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "!=": operator.ne,
+    "==": operator.eq,
+    "=": operator.eq,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+numeric_fields = {"id", "age", "apps", "market_value", "totw", "motm", "avg_rating", "totw_rate"}
+text_fields = {"name", "team", "position"}
+
+clause_pattern = re.compile(r"^\s*(\w+)\s*(<=|>=|!=|==|=|<|>)\s*(.+?)\s*$")
+separator_pattern = re.compile(r"(\"[^\"]*\"|'[^']*')|\s+(and|or)\s+|,", re.IGNORECASE)
+
+
+def parse_number(value):
+    """
+    Parses numbers with optional € prefix and K/M/B suffix, e.g. "€5M" or "2.5m".
+    """
+    match = re.match(r"^€?(\d+(?:\.\d+)?)([kmb]?)$", value.strip().lower())
+    if not match:
+        raise ValueError(f"Expected a number, got {value!r}")
+
+    number, suffix = match.groups()
+    return float(number) * {"": 1, "k": 1000, "m": 1000000, "b": 1000000000}[suffix]
+
+
+def compile_clause(clause):
+    match = clause_pattern.match(clause)
+    if not match:
+        raise ValueError(f"Invalid clause {clause!r}, expected 'field op value'")
+
+    field, op, value = match.groups()
+    field = field.lower()
+    compare = operators[op]
+    if field in numeric_fields:
+        value = parse_number(value)
+
+        def predicate(row):
+            v = row[field]
+            return v is not None and compare(v, value)
+    elif field in text_fields:
+        if compare not in (operator.eq, operator.ne):
+            raise ValueError(f"Only = and != are supported for {field}")
+        value = value.strip("\"'").lower()
+        matches = (lambda v: value in v.lower().split("/")) if field == "position" else (lambda v: v.lower() == value)
+
+        def predicate(row):
+            return compare(bool(row[field]) and matches(row[field]), True)
+    else:
+        raise ValueError(f"Unknown field {field!r}, expected one of {sorted(numeric_fields | text_fields)}")
+
+    return predicate
+
+
+def split_expression(expression):
+    """
+    Splits expression into "or" groups of "and" clauses, ignoring separators
+    inside quoted values.
+    """
+    groups = [[]]
+    start = 0
+    for match in separator_pattern.finditer(expression):
+        if match.group(1):
+            continue
+
+        groups[-1].append(expression[start:match.start()])
+        if (match.group(2) or "").lower() == "or":
+            groups.append([])
+        start = match.end()
+
+    groups[-1].append(expression[start:])
+    return [[c for c in group if c.strip()] for group in groups]
+
+
+def compile_expression(expression):
+    """
+    Compiles expression into a single row predicate. An empty expression matches every row.
+    """
+    if not expression or not expression.strip():
+        return lambda row: True
+
+    groups = [[compile_clause(c) for c in group] for group in split_expression(expression.strip())]
+    return lambda row: any(all(p(row) for p in clauses) for clauses in groups)
+
+
+def parse_weights(rank):
+    """
+    Parses "totw_rate=1,avg_rating=0.5" into {"totw_rate": 1.0, "avg_rating": 0.5}.
+    A bare field name gets weight 1.
+    """
+    weights = {}
+    for item in (rank or "totw").split(","):
+        field, _, weight = item.partition("=")
+        field = field.strip().lower()
+        if field not in numeric_fields:
+            raise ValueError(f"Can't rank by {field!r}, expected one of {sorted(numeric_fields)}")
+        weights[field] = float(weight) if weight.strip() else 1.0
+    return weights
+
+
+def get_rows(player_index, totw_index, league_ids=None, min_season_year=None):
+    """
+    Joins player index records with merged TOTW stats. When league_ids are given
+    only players with a TOTW in those leagues are returned.
+    """
+    totw_stats = totw_index.get_player_stats(league_ids, min_season_year)
+    player_ids = totw_stats.keys() if league_ids else player_index.records.keys()
+    empty_stats = {"totw": 0, "motm": 0, "avg_rating": None}
+    rows = []
+    for player_id in player_ids:
+        record = player_index.records.get(player_id)
+        if not record:
+            continue
+
+        stats = totw_stats.get(player_id, empty_stats)
+        rows.append({
+            "name": record["name"],
+            "id": player_id,
+            "position": "/".join(record["positions"]),
+            "age": record["age"],
+            "apps": record["apps"],
+            "market_value": record["market_value"],
+            "team": record["team_name"],
+            "totw": stats["totw"],
+            "motm": stats["motm"],
+            "avg_rating": stats["avg_rating"],
+            "totw_rate": round(stats["totw"] / record["apps"], 3) if record["apps"] else None
+        })
+    return rows
+
+
+def get_normalizers(rows, fields):
+    """
+    Returns a function per field scaling its values to 0-1 (min-max) across rows.
+    Missing values score 0.
+    """
+    normalizers = {}
+    for field in fields:
+        values = [row[field] for row in rows if row[field] is not None]
+        low, high = (min(values), max(values)) if values else (0, 0)
+        if high > low:
+            normalizers[field] = lambda v, low=low, high=high: 0 if v is None else (v - low) / (high - low)
+        else:
+            normalizers[field] = lambda v: 0 if v is None else 1
+    return normalizers
+
+
+def run_query(rows, expression=None, rank=None, limit=None):
+    """
+    Filters rows by expression and returns them sorted by weighted score, highest
+    first. Ranked fields are min-max normalized across the matching rows before
+    weighting, so fields on different scales are comparable.
+    """
+    predicate = compile_expression(expression)
+    weights = parse_weights(rank)
+    results = [row for row in rows if predicate(row)]
+    normalizers = get_normalizers(results, weights)
+    for row in results:
+        row["score"] = round(sum(w * normalizers[f](row[f]) for f, w in weights.items()), 3)
+
+    results = sorted(results, key=lambda r: -r["score"])
+    return results[:limit] if limit else results
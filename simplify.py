@@ -0,0 +1,67 @@
+"""
+Pure functions for simplifying raw Fotmob api payloads. Importing this module
+has no side effects, so process pool workers can import it cheaply.
+"""
+
+import json
+
+
+def get_player_simplified(player):
+    """
+    Takes player data with Fotmob API schema and returns dict with simplified collection of data. 
+    Intent to be used to save player data to local database.
+
+    param: player (dict)
+
+    returns: dict - simplfied
+    """
+    player_props_data = {}
+    position_data = player["origin"]["positionDesc"]
+    positions = sorted(position_data.get("positions", []), key=lambda d: (-d["isMainPosition"], d["occurences"]))
+    positions = [p["strPosShort"]["label"] for p in positions]
+    for prop in player["playerProps"]:
+        title = "_".join(prop["title"].split()).lower()
+        player_props_data[title] = prop["value"]["key"] or prop["value"]["fallback"]
+    
+    clubs = []
+    career_history_info = player["careerHistory"]
+    if career_history_info["fullCareer"]:
+        for club in career_history_info["careerData"]["careerItems"]["senior"]:
+            if not club["hasUncertainData"]:
+                clubs.append({
+                    "team_name": club["team"],
+                    "team_id": club["teamId"],
+                    "transfer_type": club["transferType"],
+                    "start_date": club["startDate"],
+                    "end_date": club.get("endDate"),
+                    "appearances": club["appearances"]
+                })
+
+    return {
+        "id": player["id"],
+        "name": player["name"],
+        "on_loan": player["origin"].get("onLoan"),
+        "team": {
+            "name": player["origin"].get("teamName"),
+            "id": player["origin"].get("teamId")
+        },
+        "positions": positions,
+        "clubs": clubs,
+        **player_props_data
+    }
+
+
+def simplify_payload(item):
+    """
+    Decodes and simplifies a raw playerData payload. Runs in worker processes.
+    item is (source, payload), where source is a player id or archive path.
+    Returns (source, player, error).
+    """
+    source, payload = item
+    if not payload:
+        return source, None, "no payload"
+
+    try:
+        return source, get_player_simplified(json.loads(payload)), None
+    except (KeyError, TypeError, ValueError) as e:
+        return source, None, f"{type(e).__name__}: {e}"
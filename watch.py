@@ -0,0 +1,261 @@
+"""
+Long-running watcher that polls leagues for new TOTW rounds and transfers.
+
+State is kept per league under data/watch: the last round seen, the latest
+transfer date seen for each team and a poll schedule for each endpoint. An
+endpoint that returns nothing new (or fails) is polled half as often, up to
+max_interval, and goes back to its base interval as soon as something changes,
+so request volume follows what changes rather than league size.
+"""
+
+import api
+import ingest
+
+import json
+import os
+import time
+from datetime import datetime
+
+import requests
+
+state_dir = f"{api.data_dir}/watch"
+logger = api.logger
+
+# Longest wait between retries of a round that has no TOTW yet.
+max_round_interval = 24 * 60 * 60
+# How long a round can go without a TOTW before later rounds are polled past it.
+stale_round_age = 21 * 24 * 60 * 60
+
+
+class LeagueWatcher:
+    """
+    Polls one league for deltas, saving new TOTW rounds and transfers to the
+    local store and indexes.
+    """
+
+    def __init__(self, league_id, season_year=None, totw_interval=3600, transfer_interval=21600, max_interval=604800):
+        self.league_id = league_id
+        self.season_year = season_year or datetime.today().year
+        self.totw_interval = totw_interval
+        self.transfer_interval = transfer_interval
+        self.max_interval = max_interval
+        self.path = f"{state_dir}/{league_id}.json"
+        self.state = self.load_state()
+        api.index_cached_league_totws(league_id)
+
+    def load_state(self):
+        state = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                state = json.load(f)
+
+        if state.get("season_year") != self.season_year:
+            state = {"season_year": self.season_year}
+
+        state.setdefault("rounds_link", None)
+        state.setdefault("last_round_id", None)
+        state.setdefault("empty_rounds", [])
+        state.setdefault("pending_rounds", {})
+        state.setdefault("teams", {})
+        state.setdefault("polled_teams", [])
+        state.setdefault("pending_transfers", {"players_in": [], "players_out": []})
+        state.setdefault("endpoints", {})
+        return state
+
+    def save_state(self):
+        os.makedirs(state_dir, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.state, f)
+
+    def is_due(self, endpoint, now):
+        schedule = self.state["endpoints"].get(endpoint)
+        return not schedule or schedule["next_poll"] <= now
+
+    def schedule(self, endpoint, base_interval, changed=False, failed=False):
+        """
+        Schedules the next poll of endpoint, backing off if it failed or had nothing new.
+        """
+        schedule = self.state["endpoints"].get(endpoint)
+        if changed or not schedule:
+            interval = base_interval
+        else:
+            interval = min(schedule["interval"] * 2, self.max_interval)
+
+        failures = (schedule or {}).get("failures", 0) + 1 if failed else 0
+        self.state["endpoints"][endpoint] = {
+            "interval": interval,
+            "failures": failures,
+            "next_poll": time.time() + interval
+        }
+
+    def get_next_poll(self):
+        return min((s["next_poll"] for s in self.state["endpoints"].values()), default=time.time())
+
+    def mark_round_published(self, round_id, unpublished):
+        """
+        Records round_id as the last round seen. Rounds before it that still have
+        no TOTW never will, so they're recorded as empty and not retried.
+        """
+        for r in unpublished:
+            if r not in self.state["empty_rounds"]:
+                self.state["empty_rounds"].append(r)
+            self.state["pending_rounds"].pop(r, None)
+        unpublished.clear()
+        self.state["pending_rounds"].pop(round_id, None)
+        self.state["last_round_id"] = round_id
+
+    def poll_totw(self):
+        """
+        Fetches rounds after the last one seen, stopping at the first round with no
+        TOTW yet. Each TOTW is saved before its round is marked seen. A round with no
+        TOTW is retried with backoff. Once it has gone stale_round_age without one it
+        stops blocking later rounds, and it's recorded as empty when a later round
+        gets a TOTW. Returns the new TOTWs.
+        """
+        totw_index = api.db.get_totw_index()
+        if not self.state["rounds_link"]:
+            self.state["rounds_link"] = api.get_league_season_totw_rounds_link(self.league_id, self.season_year)
+            if not self.state["rounds_link"]:
+                return []
+
+        response = requests.get(self.state["rounds_link"], headers=api.no_cache_headers).json()
+        rounds = [(api.get_totw_round_id(r["link"]), r["link"]) for r in dict(response or {}).get("rounds") or []]
+        round_ids = [round_id for round_id, _ in rounds]
+        if self.state["last_round_id"] in round_ids:
+            rounds = rounds[round_ids.index(self.state["last_round_id"]) + 1:]
+
+        now = time.time()
+        pending_rounds = self.state["pending_rounds"]
+        unpublished = []
+        totws = []
+        for round_id, link in rounds:
+            if round_id in self.state["empty_rounds"]:
+                continue
+
+            if totw_index.has_round(self.league_id, self.season_year, round_id):
+                self.mark_round_published(round_id, unpublished)
+                continue
+
+            pending = pending_rounds.get(round_id) or {}
+            stale = bool(pending) and now - pending["first_miss"] >= stale_round_age
+            if pending and pending["next_poll"] > now:
+                if stale:
+                    unpublished.append(round_id)
+                    continue
+                break
+
+            totw = requests.get(link, headers=api.no_cache_headers).json()
+            time.sleep(0.1)
+            if not totw or "errorMessage" in totw:
+                misses = pending.get("misses", 0) + 1
+                pending_rounds[round_id] = {
+                    "misses": misses,
+                    "first_miss": pending.get("first_miss", now),
+                    "next_poll": now + min(self.totw_interval * 2 ** (misses - 1), max_round_interval)
+                }
+                if stale:
+                    unpublished.append(round_id)
+                    continue
+                break
+
+            totw = {"round": round_id, **totw}
+            api.append_league_season_totw(self.league_id, self.season_year, [totw])
+            logger.success(f"New TOTW for league {self.league_id} round {round_id}")
+            totws.append(totw)
+            self.mark_round_published(round_id, unpublished)
+
+        if totws:
+            ingest.ingest_players(p["participantId"] for t in totws for p in t["players"])
+
+        return totws
+
+    def discover_teams(self):
+        league = api.get_league(self.league_id)
+        self.state["teams"] = {str(t["id"]): None for t in league["table"][0]["data"]["table"]["all"]}
+        return self.state["teams"]
+
+    def poll_team_transfers(self, team_id):
+        """
+        Collects transfers for team_id dated on or after the last one seen.
+        Transfers are held in the watcher's state until every team has been polled
+        once (or the league's transfer list is already saved), so the saved list is
+        never a partial one. Returns the new transfers found.
+        """
+        team = api.get_team(team_id)
+        data = (team.get("transfers") or {}).get("data") or {}
+        last_date = self.state["teams"].get(str(team_id))
+        pending = self.state["pending_transfers"]
+        found = []
+        latest = last_date
+        for key, group in (("players_in", "Players in"), ("players_out", "Players out")):
+            seen = {(t["id"], t["date"], t["from_club"], t["to_club"]) for t in pending[key]}
+            for t in data.get(group) or []:
+                if last_date and t["transferDate"] < last_date:
+                    continue
+
+                row = api.get_transfer_row(t)
+                if (row["id"], row["date"], row["from_club"], row["to_club"]) in seen:
+                    continue
+
+                pending[key].append(row)
+                found.append(row)
+                latest = max(latest or t["transferDate"], t["transferDate"])
+
+        self.state["teams"][str(team_id)] = latest
+        if str(team_id) not in self.state["polled_teams"]:
+            self.state["polled_teams"].append(str(team_id))
+
+        all_polled = set(self.state["teams"]) <= set(self.state["polled_teams"])
+        if all_polled or os.path.exists(api.get_league_transfers_path(self.league_id)):
+            added = api.append_league_transfers(self.league_id, pending)
+            self.state["pending_transfers"] = {"players_in": [], "players_out": []}
+            if added:
+                logger.success(f"{len(added)} new transfers for league {self.league_id}")
+                ingest.ingest_players([t["id"] for t in added], refresh=True)
+            return added
+
+        return found
+
+    def poll_endpoint(self, endpoint, base_interval, poll):
+        """
+        Runs poll and schedules endpoint's next poll. Failures are logged and backed
+        off, so one bad endpoint doesn't stop the watcher.
+        """
+        try:
+            changed = bool(poll())
+        except Exception as e:
+            logger.error(f"Failed polling {endpoint} for league {self.league_id}: {e}")
+            self.schedule(endpoint, base_interval, failed=True)
+        else:
+            self.schedule(endpoint, base_interval, changed=changed)
+        self.save_state()
+
+    def poll(self):
+        """
+        Polls every endpoint that is due. Returns the time of the next poll.
+        """
+        now = time.time()
+        if self.is_due("totw", now):
+            self.poll_endpoint("totw", self.totw_interval, self.poll_totw)
+
+        if not self.state["teams"] and self.is_due("teams", now):
+            self.poll_endpoint("teams", self.transfer_interval, self.discover_teams)
+
+        for team_id in list(self.state["teams"]):
+            endpoint = f"transfers/{team_id}"
+            if self.is_due(endpoint, now):
+                self.poll_endpoint(endpoint, self.transfer_interval, lambda: self.poll_team_transfers(int(team_id)))
+
+        return self.get_next_poll()
+
+
+def watch(league_ids, once=False, **kwargs):
+    watchers = [LeagueWatcher(league_id, **kwargs) for league_id in league_ids]
+    while True:
+        next_poll = min(w.poll() for w in watchers)
+        if once:
+            return
+
+        wait = max(next_poll - time.time(), 1)
+        logger.info(f"Next poll in {round(wait / 60, 1)}m")
+        time.sleep(wait)